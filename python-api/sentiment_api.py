@@ -1,14 +1,29 @@
 import torch
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+import functools
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
 import sys
+import threading
+import time
 
-# Set up logging
+# Set up logging: records go through a queue to a background listener
+# thread, so request threads never block on stderr IO
 logging.basicConfig(level=logging.INFO)
+_log_queue = queue.Queue(-1)
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+_root_logger = logging.getLogger()
+_root_logger.handlers.clear()  # replace basicConfig's synchronous handler
+_root_logger.addHandler(QueueHandler(_log_queue))
 logger = logging.getLogger(__name__)
 
+# This process only serves inference, so disable autograd globally
+torch.set_grad_enabled(False)
+
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -49,6 +64,7 @@ device_name = "CPU"
 
 # Check if device is specified via environment variable
 import os
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")  # multi-threaded batch encode
 device_env = os.environ.get('SENTIMENT_DEVICE', '').lower()
 if device_env == 'gpu' and torch.cuda.is_available():
     device = 0
@@ -76,17 +92,210 @@ if device == 0 and torch.cuda.is_available():
 # Using Indonesian sentiment analysis model
 pretrained = "mdhugol/indonesia-bert-sentiment-classification"
 logger.info("Loading model...")
-model = AutoModelForSequenceClassification.from_pretrained(pretrained)
-tokenizer = AutoTokenizer.from_pretrained(pretrained)
+# low_cpu_mem_usage mmaps the weights instead of materializing a full RAM
+# copy; loading directly in the target dtype avoids a second conversion pass
+model = AutoModelForSequenceClassification.from_pretrained(
+    pretrained,
+    low_cpu_mem_usage=True,
+    torch_dtype=torch.float16 if device == 0 and torch.cuda.is_available() else torch.float32
+)
+model.eval()  # inference only: use eval-mode kernels (no dropout)
+tokenizer = AutoTokenizer.from_pretrained(pretrained, use_fast=True)
 
 # Move model to GPU if available and selected
 if device == 0 and torch.cuda.is_available():
     logger.info("Moving model to GPU...")
     model = model.to("cuda")
 
-logger.info("Creating sentiment analysis pipeline...")
-sentiment_pipeline = pipeline("sentiment-analysis", model=model, tokenizer=tokenizer, device=device)
-logger.info("Pipeline created successfully!")
+def load_onnx_model(pretrained):
+    """Try to load the model through ONNX Runtime for faster CPU inference.
+
+    Uses optimum's ORT wrapper, which exports the model to ONNX with graph
+    optimizations (fused attention/LayerNorm, constant folding). Returns
+    None when the optional optimum/onnxruntime dependencies are missing or
+    the export fails, so the PyTorch model stays in use.
+    """
+    try:
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+    except ImportError:
+        logger.info("optimum/onnxruntime not installed, using PyTorch on CPU")
+        return None
+
+    try:
+        onnx_model = ORTModelForSequenceClassification.from_pretrained(pretrained, export=True)
+        logger.info("Model loaded through ONNX Runtime")
+        return onnx_model
+    except Exception as e:
+        logger.warning(f"ONNX export failed, using PyTorch model: {e}")
+        return None
+
+# On CPU, prefer the ONNX Runtime backend when available
+if device == -1:
+    onnx_model = load_onnx_model(pretrained)
+    if onnx_model is not None:
+        model = onnx_model
+    else:
+        # Dynamic INT8 quantization: int8 linear weights cut memory traffic
+        # ~4x and dispatch to int8 dot-product kernels on modern x86
+        try:
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            logger.info("Applied dynamic INT8 quantization to linear layers")
+        except Exception as e:
+            logger.warning(f"Dynamic quantization failed, using FP32 model: {e}")
+
+# Batch size for /analyze-batch: larger batches pay off on GPU, smaller on CPU
+pipeline_batch_size = 32 if device == 0 else 8
+
+def build_scripted_infer(model):
+    """Try to freeze model + softmax + argmax into one TorchScript graph.
+
+    Returns a callable (input_ids, attention_mask) -> (class ids,
+    confidences) with shape ops constant-folded and the post-processing
+    fused in-graph, or None when the active backend can't be traced
+    (e.g. the ONNX Runtime model).
+    """
+    if not isinstance(model, torch.nn.Module):
+        return None
+
+    class Infer(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            logits = self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+            probs = logits.float().softmax(-1)
+            return probs.argmax(-1), probs.max(-1).values
+
+    try:
+        example_device = "cuda" if device == 0 and torch.cuda.is_available() else "cpu"
+        example = (
+            torch.zeros(1, 128, dtype=torch.long, device=example_device),
+            torch.ones(1, 128, dtype=torch.long, device=example_device)
+        )
+        traced = torch.jit.trace(Infer(model).eval(), example, strict=False)
+        scripted = torch.jit.freeze(traced)
+        logger.info("Inference path frozen with TorchScript")
+        return scripted
+    except Exception as e:
+        logger.warning(f"TorchScript freeze failed, using eager inference: {e}")
+        return None
+
+scripted_infer = build_scripted_infer(model)
+
+@functools.lru_cache(maxsize=4096)
+def encode_text(text):
+    """Tokenize a single text, cached so repeated requests skip the BPE work."""
+    return tokenizer(
+        text,
+        return_tensors="pt",
+        truncation=True,
+        max_length=128,
+        padding=True,
+        pad_to_multiple_of=8  # Tensor Core / fused-kernel alignment
+    )
+
+def predict_text(text):
+    """Analyze a single text with a direct model call, skipping pipeline overhead."""
+    enc = encode_text(text)
+    if device == 0 and torch.cuda.is_available():
+        enc = {k: v.to("cuda") for k, v in enc.items()}
+    with torch.inference_mode():
+        if scripted_infer is not None:
+            indices, scores = scripted_infer(enc["input_ids"], enc["attention_mask"])
+            return f"LABEL_{int(indices[0])}", float(scores[0])
+        logits = model(**enc).logits
+    probs = logits.float().softmax(-1)[0]
+    idx = int(probs.argmax())
+    return f"LABEL_{idx}", float(probs[idx])
+
+def predict_texts(texts):
+    """Run sentiment analysis on a list of texts, returning (label, score) pairs.
+
+    Texts are sorted by token length and run in sub-batches that pad only
+    to their local maximum (attention is O(L^2)), so short texts don't pay
+    for pad tokens introduced by one long outlier.
+    """
+    if len(texts) == 1:
+        return [predict_text(texts[0])]
+
+    token_ids = tokenizer(texts, truncation=True, max_length=128)["input_ids"]
+    order = sorted(range(len(texts)), key=lambda i: len(token_ids[i]))
+
+    predictions = [None] * len(texts)
+    for start in range(0, len(order), pipeline_batch_size):
+        chunk = order[start:start + pipeline_batch_size]
+        enc = tokenizer(
+            [texts[i] for i in chunk],
+            return_tensors="pt",
+            truncation=True,
+            max_length=128,
+            padding="longest",
+            pad_to_multiple_of=8
+        )
+        if device == 0 and torch.cuda.is_available():
+            enc = {k: v.to("cuda") for k, v in enc.items()}
+        with torch.inference_mode():
+            if scripted_infer is not None:
+                indices, scores = scripted_infer(enc["input_ids"], enc["attention_mask"])
+            else:
+                probs = model(**enc).logits.float().softmax(-1)
+                scores, indices = probs.max(-1)
+        for i, idx, score in zip(chunk, indices, scores):
+            predictions[i] = (f"LABEL_{int(idx)}", float(score))
+    return predictions
+
+class DynamicBatcher:
+    """Group concurrent single-text requests into one batched forward pass.
+
+    /analyze requests arriving while an inference is in flight are queued;
+    a background worker drains up to max_batch of them (waiting at most
+    max_wait_s for stragglers) and runs them as a single batch, turning
+    vector-matrix into matrix-matrix work under concurrent load.
+    """
+
+    def __init__(self, predict_fn, max_batch=32, max_wait_s=0.005):
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_s
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def _run(self):
+        while True:
+            items = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait_s
+            while len(items) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                predictions = self.predict_fn([text for text, _ in items])
+                for (_, slot), prediction in zip(items, predictions):
+                    slot['result'] = prediction
+                    slot['done'].set()
+            except Exception as e:
+                for _, slot in items:
+                    slot['error'] = e
+                    slot['done'].set()
+
+    def predict(self, text):
+        slot = {'done': threading.Event(), 'result': None, 'error': None}
+        self.queue.put((text, slot))
+        slot['done'].wait()
+        if slot['error'] is not None:
+            raise slot['error']
+        return slot['result']
+
+batcher = DynamicBatcher(predict_texts, max_batch=pipeline_batch_size)
 
 # Label mapping for IndoBERT sentiment analysis
 label_mapping = {
@@ -136,13 +345,9 @@ def analyze_sentiment():
             return jsonify({"error": "Empty text provided"}), 400
         
         # Perform sentiment analysis
-        logger.info(f"Analyzing sentiment for text: {text[:50]}...")
-        results = sentiment_pipeline(text)
-        
-        # Extract the label and score
-        original_label = results[0]['label']
-        score = results[0]['score']
-        
+        logger.debug("Analyzing sentiment for text: %.50s...", text)
+        original_label, score = batcher.predict(text)
+
         # Map to our standard labels
         mapped_label = label_mapping.get(original_label, 'neutral')  # default to neutral if not found
         
@@ -157,7 +362,7 @@ def analyze_sentiment():
         }), 200
         
     except Exception as e:
-        logger.error(f"Error analyzing sentiment: {str(e)}")
+        logger.error("Error analyzing sentiment: %s", e)
         return jsonify({"error": f"Error analyzing sentiment: {str(e)}"}), 500
 
 @app.route('/analyze-batch', methods=['POST'])
@@ -181,56 +386,66 @@ def analyze_sentiment_batch():
         if len(texts) == 0:
             return jsonify({"error": "Empty texts list provided"}), 400
         
-        # Perform sentiment analysis for each text
-        results = []
+        # Separate valid texts from invalid entries so the model sees one batch
+        results = [None] * len(texts)
+        valid_texts = []
+        valid_indices = []
         for i, text in enumerate(texts):
             if not isinstance(text, str):
-                results.append({
+                results[i] = {
                     "index": i,
                     "error": "Text must be a string"
-                })
-                continue
-                
-            if not text.strip():
-                results.append({
+                }
+            elif not text.strip():
+                results[i] = {
                     "index": i,
                     "error": "Empty text provided"
-                })
-                continue
-            
+                }
+            else:
+                valid_texts.append(text)
+                valid_indices.append(i)
+
+        # Run all valid texts through the pipeline in one batched call
+        if valid_texts:
             try:
-                logger.info(f"Analyzing sentiment for text {i+1}/{len(texts)}: {text[:50]}...")
-                analysis = sentiment_pipeline(text)
-                
-                # Extract the label and score
-                original_label = analysis[0]['label']
-                score = analysis[0]['score']
-                
-                # Map to our standard labels
-                mapped_label = label_mapping.get(original_label, 'neutral')  # default to neutral if not found
-                
-                results.append({
-                    "index": i,
-                    "label": mapped_label,
-                    "confidence": score,
-                    "original_label": original_label,
-                    "scores": {
-                        mapped_label: score
+                logger.info("Analyzing sentiment for batch of %d texts...", len(valid_texts))
+                predictions = predict_texts(valid_texts)
+
+                for i, (original_label, score) in zip(valid_indices, predictions):
+                    # Map to our standard labels
+                    mapped_label = label_mapping.get(original_label, 'neutral')  # default to neutral if not found
+
+                    results[i] = {
+                        "index": i,
+                        "label": mapped_label,
+                        "confidence": score,
+                        "original_label": original_label,
+                        "scores": {
+                            mapped_label: score
+                        }
                     }
-                })
             except Exception as e:
-                logger.error(f"Error analyzing sentiment for text {i}: {str(e)}")
-                results.append({
-                    "index": i,
-                    "error": f"Error analyzing sentiment: {str(e)}"
-                })
+                logger.error("Error analyzing sentiment batch: %s", e)
+                for i in valid_indices:
+                    results[i] = {
+                        "index": i,
+                        "error": f"Error analyzing sentiment: {str(e)}"
+                    }
         
         # Return results
         return jsonify({"results": results}), 200
         
     except Exception as e:
-        logger.error(f"Error analyzing sentiment batch: {str(e)}")
+        logger.error("Error analyzing sentiment batch: %s", e)
         return jsonify({"error": f"Error analyzing sentiment batch: {str(e)}"}), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Serve with a production WSGI server; the Flask dev server is
+    # single-threaded and runs the debug reloader
+    try:
+        from waitress import serve
+        logger.info("Serving with waitress on port 5000...")
+        serve(app, host='0.0.0.0', port=5000, threads=16)
+    except ImportError:
+        logger.warning("waitress not installed, falling back to Flask dev server")
+        app.run(host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
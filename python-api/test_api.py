@@ -1,37 +1,65 @@
-import requests
+import statistics
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BASE_URL = 'http://localhost:5000'
+WARMUP_REQUESTS = 5
+CONCURRENCY = 32
+TOTAL_REQUESTS = 200
+
+# Shared session with a large connection pool: keep-alive avoids paying TCP
+# connection setup on every request, which dominates for light endpoints
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_connections=64, pool_maxsize=64))
+
+TEXTS = [
+    'Indonesia adalah negara yang indah.',
+    'Saya tidak suka dengan pelayanan di tempat ini.',
+    'Makanan di restoran ini enak sekali!',
+    'Cuaca hari ini biasa saja.'
+]
+
+def send(text):
+    """POST one text to /analyze and return (status code, latency in ms)."""
+    start = time.perf_counter_ns()
+    response = session.post(f'{BASE_URL}/analyze', json={'text': text})
+    elapsed_ms = (time.perf_counter_ns() - start) / 1e6
+    return response.status_code, elapsed_ms
+
+def percentile(sorted_latencies, pct):
+    index = min(len(sorted_latencies) - 1, int(len(sorted_latencies) * pct / 100))
+    return sorted_latencies[index]
 
 def test_sentiment_api():
-    # Test single text analysis
-    print("Testing single text analysis...")
-    start_time = time.time()
-    
-    response = requests.post('http://localhost:5000/analyze', json={
-        'text': 'Indonesia adalah negara yang indah dan memiliki banyak budaya yang beragam.'
-    })
-    
-    end_time = time.time()
-    print(f"Response time: {end_time - start_time:.2f} seconds")
-    print(f"Status code: {response.status_code}")
-    print(f"Response: {response.json()}")
-    
+    # Warm up so model load and first-request compilation don't skew timings
+    print(f"Warming up with {WARMUP_REQUESTS} requests...")
+    for _ in range(WARMUP_REQUESTS):
+        send(TEXTS[0])
+
+    # Fire concurrent single-text requests to exercise the server-side batcher
+    print(f"Sending {TOTAL_REQUESTS} requests across {CONCURRENCY} threads...")
+    payloads = [TEXTS[i % len(TEXTS)] for i in range(TOTAL_REQUESTS)]
+    with ThreadPoolExecutor(CONCURRENCY) as executor:
+        outcomes = list(executor.map(send, payloads))
+
+    latencies = sorted(elapsed for _, elapsed in outcomes)
+    errors = sum(1 for status, _ in outcomes if status != 200)
+    print(f"Errors: {errors}/{TOTAL_REQUESTS}")
+    print(f"p50 latency: {percentile(latencies, 50):.2f} ms")
+    print(f"p99 latency: {percentile(latencies, 99):.2f} ms")
+    print(f"Mean latency: {statistics.mean(latencies):.2f} ms")
+
     # Test batch analysis
     print("\nTesting batch analysis...")
-    start_time = time.time()
-    
-    response = requests.post('http://localhost:5000/analyze-batch', json={
-        'texts': [
-            'Indonesia adalah negara yang indah.',
-            'Saya tidak suka dengan pelayanan di tempat ini.',
-            'Makanan di restoran ini enak sekali!',
-            'Cuaca hari ini biasa saja.'
-        ]
-    })
-    
-    end_time = time.time()
-    print(f"Response time: {end_time - start_time:.2f} seconds")
+    start = time.perf_counter_ns()
+    response = session.post(f'{BASE_URL}/analyze-batch', json={'texts': TEXTS})
+    elapsed_ms = (time.perf_counter_ns() - start) / 1e6
+    print(f"Response time: {elapsed_ms:.2f} ms")
     print(f"Status code: {response.status_code}")
     print(f"Response: {response.json()}")
 
 if __name__ == "__main__":
-    test_sentiment_api()
\ No newline at end of file
+    test_sentiment_api()
@@ -0,0 +1,76 @@
+import functools
+import json
+import logging
+import os
+from http.server import BaseHTTPRequestHandler
+
+# Cache model downloads in /tmp so warm lambda instances skip the hub fetch
+os.environ.setdefault("TRANSFORMERS_CACHE", "/tmp/hf")
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Indonesian sentiment analysis model (same as the Flask APIs)
+pretrained = "mdhugol/indonesia-bert-sentiment-classification"
+
+# Label table indexed by the model's argmax class id (LABEL_0/1/2)
+labels = ('positive', 'neutral', 'negative')
+
+@functools.cache
+def get_model():
+    """Load the tokenizer and model once per serverless instance.
+
+    Loads through ONNX Runtime only: if the dependencies are missing or
+    the load fails, the exception propagates and the instance crashes on
+    cold start, which is what we want on Vercel — the platform restarts
+    the function instead of silently serving a wrong-language fallback.
+    """
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(pretrained, use_fast=True)
+    model = ORTModelForSequenceClassification.from_pretrained(pretrained, export=True)
+    logger.info("Loaded model through ONNX Runtime")
+    return tokenizer, model
+
+class handler(BaseHTTPRequestHandler):
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        # Validate the request before touching the model so error responses
+        # stay cheap even on a cold instance
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            data = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, json.JSONDecodeError):
+            return self._send_json(400, {"error": "Invalid JSON body"})
+
+        if not isinstance(data, dict) or 'text' not in data:
+            return self._send_json(400, {"error": "No text provided"})
+
+        text = data['text']
+        if not isinstance(text, str) or not text.strip():
+            return self._send_json(400, {"error": "Empty text provided"})
+
+        tokenizer, model = get_model()
+        enc = tokenizer(text, return_tensors="pt", truncation=True, max_length=128)
+        probs = model(**enc).logits.softmax(-1)[0]
+        idx = int(probs.argmax())
+        mapped_label = labels[idx]
+        score = float(probs[idx])
+
+        return self._send_json(200, {
+            "label": mapped_label,
+            "confidence": score,
+            "original_label": f"LABEL_{idx}",
+            "scores": {
+                mapped_label: score
+            }
+        })